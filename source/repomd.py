@@ -1,20 +1,56 @@
 import datetime
+import functools
 import gzip
 import io
-import defusedxml.lxml
+import lxml.etree
 import pathlib
 import urllib.request
 import urllib.parse
 
 
-_ns = {
-    'common': 'http://linux.duke.edu/metadata/common',
-    'repo':   'http://linux.duke.edu/metadata/repo',
-    'rpm':    'http://linux.duke.edu/metadata/rpm'
-}
+# read compressed metadata in 128 KiB chunks, the same size cpython's gzip module settled on
+_READ_BUFFER_SIZE = 128 * 1024
 
+# entities are never expanded and nothing is fetched from the network while parsing untrusted metadata
+# shared by the repomd.xml parser and the primary.xml iterparse so both inputs get the same hardening
+_PARSER_OPTIONS = {'resolve_entities': False, 'no_network': True, 'collect_ids': False}
+_PARSER = lxml.etree.XMLParser(**_PARSER_OPTIONS)
+
+# clark notation prefixes, tag names built from them are compared directly against element.tag
+_COMMON_NS = '{http://linux.duke.edu/metadata/common}'
+_REPO_NS = '{http://linux.duke.edu/metadata/repo}'
+_RPM_NS = '{http://linux.duke.edu/metadata/rpm}'
+
+_TAG_DATA = _REPO_NS + 'data'
+_TAG_DATA_LOCATION = _REPO_NS + 'location'
+
+_TAG_PACKAGE = _COMMON_NS + 'package'
+_TAG_NAME = _COMMON_NS + 'name'
+_TAG_ARCH = _COMMON_NS + 'arch'
+_TAG_VERSION = _COMMON_NS + 'version'
+_TAG_SUMMARY = _COMMON_NS + 'summary'
+_TAG_DESCRIPTION = _COMMON_NS + 'description'
+_TAG_PACKAGER = _COMMON_NS + 'packager'
+_TAG_URL = _COMMON_NS + 'url'
+_TAG_TIME = _COMMON_NS + 'time'
+_TAG_SIZE = _COMMON_NS + 'size'
+_TAG_LOCATION = _COMMON_NS + 'location'
+_TAG_FORMAT = _COMMON_NS + 'format'
+_TAG_LICENSE = _RPM_NS + 'license'
+_TAG_VENDOR = _RPM_NS + 'vendor'
+_TAG_SOURCERPM = _RPM_NS + 'sourcerpm'
+
+
+# packages from one build run share timestamps, and most callers never read build_time at all
+@functools.lru_cache(maxsize=4096)
+def _fromtimestamp(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp)
+
+
+def load(baseurl, opener=None):
+    # callers may pass their own opener, otherwise honour whatever urllib.request.install_opener() set up
+    open_url = opener.open if opener is not None else urllib.request.urlopen
 
-def load(baseurl):
     # parse baseurl to allow manipulating the path
     base = urllib.parse.urlparse(baseurl)
     path = pathlib.PurePosixPath(base.path)
@@ -24,31 +60,40 @@ def load(baseurl):
     repomd_url = base._replace(path=str(repomd_path)).geturl()
 
     # download and parse repomd.xml
-    with urllib.request.urlopen(repomd_url) as response:
-        repomd_xml = defusedxml.lxml.fromstring(response.read())
+    with open_url(repomd_url) as response:
+        repomd_xml = lxml.etree.fromstring(response.read(), parser=_PARSER)
 
     # determine the location of *primary.xml.gz
-    primary_element = repomd_xml.find('repo:data[@type="primary"]/repo:location', namespaces=_ns)
+    primary_element = repomd_xml.find(f'{_TAG_DATA}[@type="primary"]/{_TAG_DATA_LOCATION}')
     primary_path = path / primary_element.get('href')
     primary_url = base._replace(path=str(primary_path)).geturl()
 
-    # download and parse *-primary.xml
-    with urllib.request.urlopen(primary_url) as response:
-        with io.BytesIO(response.read()) as compressed:
-            with gzip.GzipFile(fileobj=compressed) as uncompressed:
-                metadata = defusedxml.lxml.fromstring(uncompressed.read())
+    # download and parse *-primary.xml one package at a time
+    packages = []
+    with open_url(primary_url) as response:
+        compressed = io.BufferedReader(response, buffer_size=_READ_BUFFER_SIZE)
+        with gzip.GzipFile(fileobj=compressed) as uncompressed:
+            for _, element in lxml.etree.iterparse(uncompressed, tag=_TAG_PACKAGE, **_PARSER_OPTIONS):
+                packages.append(Package(element))
+                # drop the parsed package and its already handled siblings to keep memory bounded
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
 
-    return Repo(baseurl, metadata)
+    return Repo(baseurl, packages)
 
 
 class Repo:
     """A dnf/yum repository."""
 
-    __slots__ = ['baseurl', '_metadata']
+    __slots__ = ['baseurl', '_packages', '_by_name']
 
-    def __init__(self, baseurl, metadata):
+    def __init__(self, baseurl, packages):
         self.baseurl = baseurl
-        self._metadata = metadata
+        self._packages = packages
+        self._by_name = {}
+        for package in packages:
+            self._by_name.setdefault(package.name, []).append(package)
 
     def __repr__(self):
         return f'<{self.__class__.__name__}: "{self.baseurl}">'
@@ -57,116 +102,163 @@ class Repo:
         return self.baseurl
 
     def __len__(self):
-        return int(self._metadata.get('packages'))
+        return len(self._packages)
 
     def __iter__(self):
-        for element in self._metadata:
-            yield Package(element)
+        return iter(self._packages)
 
     def find(self, name):
-        results = self._metadata.findall(f'common:package[common:name="{name}"]', namespaces=_ns)
-        if results:
-            return Package(results[-1])
+        packages = self._by_name.get(name)
+        if packages:
+            return packages[-1]
         else:
             return None
 
     def findall(self, name):
-        return [
-            Package(element)
-            for element in self._metadata.findall(f'common:package[common:name="{name}"]', namespaces=_ns)
-        ]
+        return list(self._by_name.get(name, []))
 
 
 class Package:
     """An RPM package from a repository."""
 
-    __slots__ = ['_element']
+    __slots__ = [
+        '_name', '_arch', '_summary', '_description', '_packager', '_url', '_license', '_vendor', '_sourcerpm',
+        '_build_time', '_package_size', '_installed_size', '_archive_size', '_location',
+        '_epoch', '_version', '_release',
+        '_key', '_hash',
+    ]
 
     def __init__(self, element):
-        self._element = element
+        # collect every field in a single sweep over the children instead of one path lookup per property,
+        # the values live in private slots behind read-only properties since packages are shared by Repo
+        self._name = self._arch = self._summary = self._description = self._packager = self._url = None
+        self._license = self._vendor = self._sourcerpm = None
+        self._build_time = self._package_size = self._installed_size = self._archive_size = None
+        self._location = self._epoch = self._version = self._release = None
+        for child in element:
+            tag = child.tag
+            if tag == _TAG_NAME:
+                self._name = child.text or ''
+            elif tag == _TAG_ARCH:
+                self._arch = child.text or ''
+            elif tag == _TAG_VERSION:
+                self._epoch = child.get('epoch')
+                self._version = child.get('ver')
+                self._release = child.get('rel')
+            elif tag == _TAG_SUMMARY:
+                self._summary = child.text or ''
+            elif tag == _TAG_DESCRIPTION:
+                self._description = child.text or ''
+            elif tag == _TAG_PACKAGER:
+                self._packager = child.text or ''
+            elif tag == _TAG_URL:
+                self._url = child.text or ''
+            elif tag == _TAG_TIME:
+                self._build_time = int(child.get('build'))
+            elif tag == _TAG_SIZE:
+                self._package_size = int(child.get('package'))
+                self._installed_size = int(child.get('installed'))
+                self._archive_size = int(child.get('archive'))
+            elif tag == _TAG_LOCATION:
+                self._location = child.get('href')
+            elif tag == _TAG_FORMAT:
+                for entry in child:
+                    tag = entry.tag
+                    if tag == _TAG_LICENSE:
+                        self._license = entry.text or ''
+                    elif tag == _TAG_VENDOR:
+                        self._vendor = entry.text or ''
+                    elif tag == _TAG_SOURCERPM:
+                        self._sourcerpm = entry.text or ''
+        # every field above is exposed read-only, so the key used for equality and hashing cannot go stale
+        self._key = self._name, self._epoch, self._version, self._release, self._arch
+        self._hash = hash(self._key)
 
     @property
     def name(self):
-        return self._element.findtext('common:name', namespaces=_ns)
+        return self._name
 
     @property
     def arch(self):
-        return self._element.findtext('common:arch', namespaces=_ns)
+        return self._arch
 
     @property
     def summary(self):
-        return self._element.findtext('common:summary', namespaces=_ns)
+        return self._summary
 
     @property
     def description(self):
-        return self._element.findtext('common:description', namespaces=_ns)
+        return self._description
 
     @property
     def packager(self):
-        return self._element.findtext('common:packager', namespaces=_ns)
+        return self._packager
 
     @property
     def url(self):
-        return self._element.findtext('common:url', namespaces=_ns)
+        return self._url
 
     @property
     def license(self):
-        return self._element.findtext('common:format/rpm:license', namespaces=_ns)
+        return self._license
 
     @property
     def vendor(self):
-        return self._element.findtext('common:format/rpm:vendor', namespaces=_ns)
+        return self._vendor
 
     @property
     def sourcerpm(self):
-        return self._element.findtext('common:format/rpm:sourcerpm', namespaces=_ns)
+        return self._sourcerpm
 
     @property
-    def build_time(self):
-        build_time = self._element.find('common:time', namespaces=_ns).get('build')
-        return datetime.datetime.fromtimestamp(int(build_time))
+    def package_size(self):
+        return self._package_size
 
     @property
-    def location(self):
-        return self._element.find('common:location', namespaces=_ns).get('href')
+    def installed_size(self):
+        return self._installed_size
 
     @property
-    def _version_info(self):
-        return self._element.find('common:version', namespaces=_ns)
+    def archive_size(self):
+        return self._archive_size
+
+    @property
+    def location(self):
+        return self._location
 
     @property
     def epoch(self):
-        return self._version_info.get('epoch')
+        return self._epoch
 
     @property
     def version(self):
-        return self._version_info.get('ver')
+        return self._version
 
     @property
     def release(self):
-        return self._version_info.get('rel')
+        return self._release
+
+    @property
+    def build_time(self):
+        if self._build_time is None:
+            return None
+        return _fromtimestamp(self._build_time)
 
     @property
     def vr(self):
-        version_info = self._version_info
-        v = version_info.get('ver')
-        r = version_info.get('rel')
-        return f'{v}-{r}'
+        return f'{self.version}-{self.release}'
 
     @property
     def nvr(self):
-        return f'{self.name}-{self.vr}'
+        return f'{self.name}-{self.version}-{self.release}'
 
     @property
     def evr(self):
-        version_info = self._version_info
-        e = version_info.get('epoch')
-        v = version_info.get('ver')
-        r = version_info.get('rel')
-        if int(e):
-            return f'{e}:{v}-{r}'
+        # epochs are stored as decimal strings, a plain comparison avoids parsing an int on every access
+        if self.epoch != '0':
+            return f'{self.epoch}:{self.version}-{self.release}'
         else:
-            return f'{v}-{r}'
+            return f'{self.version}-{self.release}'
 
     @property
     def nevr(self):
@@ -174,17 +266,13 @@ class Package:
 
     @property
     def nevra(self):
-        return f'{self.nevr}.{self.arch}'
-
-    @property
-    def _nevra_tuple(self):
-        return self.name, self.epoch, self.version, self.release, self.arch
+        return f'{self.name}-{self.evr}.{self.arch}'
 
     def __eq__(self, other):
-        return self._nevra_tuple == other._nevra_tuple
+        return self._key == other._key
 
     def __hash__(self):
-        return hash(self._nevra_tuple)
+        return self._hash
 
     def __repr__(self):
         return f'<{self.__class__.__name__}: "{self.nevra}">'
@@ -1,7 +1,11 @@
 import copy
 import datetime
+import gzip
+import io
 import pathlib
 import unittest.mock
+import urllib.request
+import urllib.response
 
 import lxml.etree
 import pytest
@@ -15,20 +19,20 @@ def load_test_repodata(base):
         repomd_xml = f.read()
     with (base / 'repodata' / 'primary.xml.gz').open(mode='rb') as f:
         primary_xml = f.read()
-    return (repomd_xml, primary_xml)
+    return (io.BytesIO(repomd_xml), io.BytesIO(primary_xml))
 
 
 @pytest.fixture
 @unittest.mock.patch('repomd.urllib.request.urlopen')
 def repo(mock_urlopen):
-    mock_urlopen.return_value.__enter__.return_value.read.side_effect = load_test_repodata('tests/data/repo')
+    mock_urlopen.side_effect = load_test_repodata('tests/data/repo')
     return repomd.load('https://example.com')
 
 
 @pytest.fixture
 @unittest.mock.patch('repomd.urllib.request.urlopen')
 def empty_repo(mock_urlopen):
-    mock_urlopen.return_value.__enter__.return_value.read.side_effect = load_test_repodata('tests/data/empty_repo')
+    mock_urlopen.side_effect = load_test_repodata('tests/data/empty_repo')
     return repomd.load('https://example.com')
 
 
@@ -49,7 +53,72 @@ def pork_ribs(repo):
 
 def test_repo(repo):
     assert repo.baseurl == 'https://example.com'
-    assert isinstance(repo._metadata, lxml.etree._Element)
+    for package in repo._packages:
+        assert isinstance(package, repomd.Package)
+
+
+def test_load_with_opener():
+    opener = unittest.mock.Mock()
+    opener.open.side_effect = load_test_repodata('tests/data/repo')
+    repo = repomd.load('https://example.com/base/', opener=opener)
+    assert len(repo) == 5
+    assert [args for args, kwargs in opener.open.call_args_list] == [
+        ('https://example.com/base/repodata/repomd.xml',),
+        ('https://example.com/base/repodata/primary.xml.gz',),
+    ]
+
+
+def test_load_uses_installed_opener():
+    repodata = iter(load_test_repodata('tests/data/repo'))
+    requested = []
+
+    class Handler(urllib.request.BaseHandler):
+        # run ahead of the default HTTPSHandler so nothing reaches the network
+        handler_order = 100
+
+        def https_open(self, request):
+            requested.append(request.full_url)
+            response = urllib.response.addinfourl(next(repodata), {}, request.full_url, 200)
+            response.msg = 'OK'
+            return response
+
+    urllib.request.install_opener(urllib.request.build_opener(Handler))
+    try:
+        repo = repomd.load('https://example.com/base/')
+    finally:
+        urllib.request.install_opener(None)
+    assert len(repo) == 5
+    assert requested == [
+        'https://example.com/base/repodata/repomd.xml',
+        'https://example.com/base/repodata/primary.xml.gz',
+    ]
+
+
+def test_parser_does_not_expand_entities():
+    xml = b'<!DOCTYPE r [<!ENTITY e "expanded">]><r>&e;</r>'
+    root = lxml.etree.fromstring(xml, parser=repomd._PARSER)
+    assert 'expanded' not in lxml.etree.tostring(root).decode()
+
+
+@unittest.mock.patch('repomd.urllib.request.urlopen')
+def test_load_does_not_expand_entities(mock_urlopen, tmp_path):
+    secret = tmp_path / 'secret'
+    secret.write_text('secret')
+    primary_xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<!DOCTYPE metadata [<!ENTITY internal "expanded"><!ENTITY external SYSTEM "{secret.as_uri()}">]>'
+        '<metadata xmlns="http://linux.duke.edu/metadata/common" packages="1">'
+        '<package type="rpm">'
+        '<name>brine</name><arch>noarch</arch><version epoch="0" ver="1" rel="1"/>'
+        '<summary>&internal;</summary><description>&external;</description>'
+        '</package>'
+        '</metadata>'
+    )
+    repomd_xml, _ = load_test_repodata('tests/data/repo')
+    mock_urlopen.side_effect = [repomd_xml, io.BytesIO(gzip.compress(primary_xml.encode()))]
+    package = repomd.load('https://example.com').find('brine')
+    assert 'expanded' not in package.summary
+    assert 'secret' not in package.description
 
 
 def test_repo_repr(repo):
@@ -81,6 +150,17 @@ def test_findall(repo):
         assert isinstance(package, repomd.Package)
 
 
+def test_findall_returns_a_new_list(repo):
+    packages = repo.findall('chicken')
+    packages.clear()
+    assert repo.findall('chicken')
+
+
+def test_find_name_with_quotes(repo):
+    assert repo.find('"chicken"') is None
+    assert repo.findall("chicken' or '1'='1") == []
+
+
 def test_iter(repo):
     for package in repo:
         assert isinstance(package, repomd.Package)
@@ -98,6 +178,9 @@ def test_package(chicken):
     assert chicken.vendor == "Carl's BBQ"
     assert chicken.sourcerpm == 'chicken-2.2.10-1.fc27.src.rpm'
     assert chicken.build_time == datetime.datetime.fromtimestamp(1525208602)
+    assert chicken.package_size == 6568
+    assert chicken.installed_size == 39
+    assert chicken.archive_size == 292
     assert chicken.location == 'chicken-2.2.10-1.fc27.noarch.rpm'
     assert chicken.epoch == '0'
     assert chicken.version == '2.2.10'
@@ -121,6 +204,9 @@ def test_package_with_epoch(brisket):
     assert brisket.vendor == "Carl's BBQ"
     assert brisket.sourcerpm == 'brisket-5.1.1-1.fc27.src.rpm'
     assert brisket.build_time == datetime.datetime.fromtimestamp(1525208602)
+    assert brisket.package_size == 6584
+    assert brisket.installed_size == 39
+    assert brisket.archive_size == 292
     assert brisket.location == 'brisket-5.1.1-1.fc27.noarch.rpm'
     assert brisket.epoch == '1'
     assert brisket.version == '5.1.1'
@@ -144,6 +230,9 @@ def test_subpackage(pork_ribs):
     assert pork_ribs.vendor == "Carl's BBQ"
     assert pork_ribs.sourcerpm == 'ribs-3.2.0-1.fc27.src.rpm'
     assert pork_ribs.build_time == datetime.datetime.fromtimestamp(1525208603)
+    assert pork_ribs.package_size == 6572
+    assert pork_ribs.installed_size == 41
+    assert pork_ribs.archive_size == 300
     assert pork_ribs.location == 'pork-ribs-3.2.0-1.fc27.noarch.rpm'
     assert pork_ribs.epoch == '0'
     assert pork_ribs.version == '3.2.0'
@@ -155,6 +244,26 @@ def test_subpackage(pork_ribs):
     assert pork_ribs.nevra == 'pork-ribs-3.2.0-1.fc27.noarch'
 
 
+@pytest.mark.parametrize('field', [
+    'name', 'arch', 'summary', 'description', 'packager', 'url', 'license', 'vendor', 'sourcerpm',
+    'build_time', 'package_size', 'installed_size', 'archive_size', 'location', 'epoch', 'version', 'release',
+])
+def test_package_fields_are_read_only(chicken, field):
+    with pytest.raises(AttributeError):
+        setattr(chicken, field, 'changed')
+
+
+def test_package_without_time():
+    element = lxml.etree.fromstring(
+        '<package xmlns="http://linux.duke.edu/metadata/common">'
+        '<name>brine</name><arch>noarch</arch><version epoch="0" ver="1" rel="1"/>'
+        '</package>'
+    )
+    package = repomd.Package(element)
+    assert package.nevra == 'brine-1-1.noarch'
+    assert package.build_time is None
+
+
 def test_package_equals_its_copy(chicken):
     copied_chicken = copy.copy(chicken)
     assert chicken is chicken
@@ -169,6 +278,15 @@ def test_packages_can_be_used_as_dict_keys(chicken, brisket):
     assert d[copied_chicken] == 'chicken'
 
 
+def test_package_key_cannot_go_stale(chicken):
+    copied_chicken = copy.copy(chicken)
+    with pytest.raises(AttributeError):
+        chicken.version = '9.9'
+    assert chicken.nevra == 'chicken-2.2.10-1.fc27.noarch'
+    assert chicken == copied_chicken
+    assert hash(chicken) == hash(copied_chicken)
+
+
 def test_equal_packages_work_in_set(chicken, brisket):
     copied_chicken = copy.copy(chicken)
     copied_brisket = copy.copy(brisket)